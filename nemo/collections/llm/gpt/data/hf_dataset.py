@@ -135,6 +135,7 @@ class HFDatasetDataModule(pl.LightningDataModule):
         train_aliases=["train", "training"],
         test_aliases=["test", "testing"],
         val_aliases=["val", "validation", "valid", "eval"],
+        pad_seq_len_divisible=None,
         **kwargs,
     ) -> None:
         super().__init__()
@@ -159,7 +160,9 @@ class HFDatasetDataModule(pl.LightningDataModule):
         self.dataset_splits = make_dataset_splits(dataset, split, split_aliases)
 
         if collate_fn is None:
-            self._collate_fn = lambda x: HFDatasetDataModule.collate_fn(x, pad_token_id=self.pad_token_id)
+            self._collate_fn = lambda x: HFDatasetDataModule.collate_fn(
+                x, pad_token_id=self.pad_token_id, pad_seq_len_divisible=self.pad_seq_len_divisible
+            )
         else:
             self._collate_fn = collate_fn
 
@@ -170,6 +173,8 @@ class HFDatasetDataModule(pl.LightningDataModule):
         self.micro_batch_size = micro_batch_size
         self.global_batch_size = global_batch_size
         self.pad_token_id = pad_token_id
+        # round padded lengths up to a multiple of this, so that compiled models see few distinct shapes
+        self.pad_seq_len_divisible = pad_seq_len_divisible
 
         self.use_mcore_sampler = use_mcore_sampler
         self.mcore_dataloader_type = mcore_dataloader_type
@@ -180,7 +185,7 @@ class HFDatasetDataModule(pl.LightningDataModule):
         return HFDatasetDataModule(path_or_dataset=dataset, split=split, **kwargs)
 
     @staticmethod
-    def collate_fn(batch, pad_token_id=0):
+    def collate_fn(batch, pad_token_id=0, pad_seq_len_divisible=None):
         def batchify(tensor):
             if tensor.ndim == 1:
                 return tensor.unsqueeze_(0)
@@ -191,6 +196,8 @@ class HFDatasetDataModule(pl.LightningDataModule):
 
         def pad_within_micro(batch, pad_token_id):
             max_len = max(map(len, batch))
+            if pad_seq_len_divisible:
+                max_len = -(-max_len // pad_seq_len_divisible) * pad_seq_len_divisible
             return [item + [pad_token_id] * (max_len - len(item)) for item in batch]
 
         return {
@@ -219,7 +226,9 @@ class HFDatasetDataModule(pl.LightningDataModule):
         assert dataset is not None
 
         if collate_fn is None:
-            collate_fn = lambda x: HFDatasetDataModule.collate_fn(x, pad_token_id=self.pad_token_id)
+            collate_fn = lambda x: HFDatasetDataModule.collate_fn(
+                x, pad_token_id=self.pad_token_id, pad_seq_len_divisible=self.pad_seq_len_divisible
+            )
 
         return DataLoader(
             dataset,
@@ -12,10 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import importlib.util
+import inspect
+
 import lightning.pytorch as pl
 import torch
 import torch.nn.functional as F
-from torch.distributed._composable.fsdp import MixedPrecisionPolicy
+from torch.distributed._composable.fsdp import FSDPModule, MixedPrecisionPolicy
+from torch.distributed.fsdp import FullyShardedDataParallel as FSDP1
 from transformers import AutoModelForCausalLM
 
 from nemo.collections.common.tokenizers.huggingface.auto_tokenizer import AutoTokenizer
@@ -25,12 +30,159 @@ from nemo.lightning.pytorch.strategies.utils import fsdp2_strategy_parallelize
 from nemo.utils import logging
 
 
+# Only the cheap package lookup happens at import; querying the GPU would initialize CUDA,
+# which fork-based launchers (e.g. ddp_fork, ddp_notebook) refuse to start after.
+HAVE_FLASH_ATTN = importlib.util.find_spec("flash_attn") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _detect_best_attn():
+    """
+    Pick the fastest attention implementation available on this machine.
+
+    Returns "flash_attention_2" when flash-attn is installed and the current CUDA device
+    is Ampere (sm80) or newer, otherwise falls back to "sdpa". This initializes CUDA,
+    so it must only be called once the model is being configured.
+
+    Returns:
+        str: The attention implementation name understood by Hugging Face transformers.
+    """
+    if not HAVE_FLASH_ATTN:
+        return "sdpa"
+    if not torch.cuda.is_available() or torch.cuda.get_device_capability() < (8, 0):
+        return "sdpa"
+    return "flash_attention_2"
+
+
+@functools.lru_cache(maxsize=8)
+def _load_tokenizer(model_name, use_fast, trust_remote_code):
+    """
+    Load a Hugging Face AutoTokenizer, caching instances by (model_name, use_fast, trust_remote_code).
+
+    Tokenizer construction parses vocab/merges files from disk, so reusing the instance avoids
+    paying that cost again when several models share the same tokenizer (e.g. teacher/student).
+    """
+    return AutoTokenizer(model_name, use_fast=use_fast, trust_remote_code=trust_remote_code)
+
+
+def _find_safetensors_files(model_name):
+    """
+    Find the safetensors weight files of a Hugging Face checkpoint.
+
+    `model_name` can be a local directory or a Hugging Face Hub model id, in which case only the
+    safetensors weights (and their index) are downloaded. As in `from_pretrained`, the file list
+    comes from `model.safetensors.index.json` if present, otherwise from `model.safetensors`.
+
+    Args:
+        model_name (str): The name or path of the pretrained model.
+
+    Returns:
+        list: Paths of the safetensors files; empty if the checkpoint ships no safetensors weights
+            (e.g. only `pytorch_model*.bin`).
+    """
+    import json
+    import os
+
+    if os.path.isdir(model_name):
+        path = model_name
+    else:
+        from huggingface_hub import snapshot_download
+
+        path = snapshot_download(model_name, allow_patterns=["model*.safetensors", "model.safetensors.index.json"])
+
+    index_file = os.path.join(path, "model.safetensors.index.json")
+    if os.path.isfile(index_file):
+        with open(index_file) as f:
+            weight_map = json.load(f)["weight_map"]
+        return [os.path.join(path, file) for file in sorted(set(weight_map.values()))]
+    if os.path.isfile(os.path.join(path, "model.safetensors")):
+        return [os.path.join(path, "model.safetensors")]
+    return []
+
+
+def _map_checkpoint_keys(checkpoint_keys, model):
+    """
+    Map checkpoint keys onto the model's state dict keys the way `from_pretrained` does.
+
+    Legacy `LayerNorm.gamma`/`LayerNorm.beta` names are renamed to `weight`/`bias`, and keys saved
+    without the model's `base_model_prefix` (e.g. `h.0...` for `transformer.h.0...` in GPT-2) get the
+    prefix added. Checkpoint keys the model doesn't have are dropped, as `from_pretrained` does.
+
+    Args:
+        checkpoint_keys (Iterable[str]): The tensor names stored in the checkpoint.
+        model (torch.nn.Module): The (possibly meta-initialized) Hugging Face model.
+
+    Returns:
+        tuple | None: `(key_map, tied_keys)`, where `key_map` maps checkpoint keys to model keys and
+            `tied_keys` maps each tied parameter name to the name it shares its weight with; or None
+            if some of the model's state dict entries can't be found in the checkpoint.
+    """
+    expected = set(model.state_dict().keys())
+
+    first_name, tied_keys = {}, {}
+    for name, param in model.named_parameters(remove_duplicate=False):
+        if id(param) in first_name:
+            tied_keys[name] = first_name[id(param)]
+        else:
+            first_name[id(param)] = name
+
+    prefix = getattr(model, 'base_model_prefix', '')
+    key_map = {}
+    for key in checkpoint_keys:
+        new_key = key
+        if new_key.endswith('LayerNorm.gamma'):
+            new_key = new_key[: -len('gamma')] + 'weight'
+        elif new_key.endswith('LayerNorm.beta'):
+            new_key = new_key[: -len('beta')] + 'bias'
+        if new_key not in expected and prefix and f'{prefix}.{new_key}' in expected:
+            new_key = f'{prefix}.{new_key}'
+        if new_key in expected:
+            key_map[key] = new_key
+
+    if len(expected - set(key_map.values()) - tied_keys.keys()) > 0:
+        return None
+    return key_map, tied_keys
+
+
+def _load_safetensors_state_dict(files, key_map, tied_keys):
+    """
+    Load a full state dict from safetensors files, renaming keys with `key_map`.
+
+    The files are memory-mapped, so tensors are paged in lazily. Tied parameters point to the same
+    tensor as the parameter they share their weight with.
+
+    Args:
+        files (list): Paths of the safetensors files, as returned by `_find_safetensors_files`.
+        key_map (dict): Checkpoint key to model key mapping, as returned by `_map_checkpoint_keys`.
+        tied_keys (dict): Tied parameter name to source parameter name mapping.
+
+    Returns:
+        dict: A mapping from the model's state dict keys to CPU tensors.
+    """
+    from safetensors.torch import load_file
+
+    state_dict = {}
+    for file in files:
+        for k, v in load_file(file, device="cpu").items():
+            if k in key_map:
+                state_dict[key_map[k]] = v
+    for name, source in tied_keys.items():
+        state_dict[name] = state_dict[source]
+    return state_dict
+
+
+@torch.compile(dynamic=True)
 def masked_cross_entropy(logits, targets, mask=None):
     """
     Compute the masked cross-entropy loss between logits and targets.
 
     If a mask is provided, the loss is computed per element, multiplied by the mask,
-    and then averaged. If no mask is provided, the standard cross-entropy loss is used.
+    summed and divided by the number of unmasked elements. If no mask is provided,
+    the standard cross-entropy loss is used. The function is compiled so that the
+    multiply and the reductions are fused into a single kernel.
+
+    The logits are consumed in their native dtype (bf16/fp16 are fine, the cross-entropy
+    kernel accumulates in float32 internally); only the scalar result is cast to float32.
 
     Args:
         logits (torch.Tensor): The predicted logits with shape (N, C) where C is the number of classes.
@@ -39,13 +191,184 @@ def masked_cross_entropy(logits, targets, mask=None):
             to the shape of the loss. Defaults to None.
 
     Returns:
-        torch.Tensor: The computed loss as a scalar tensor.
+        torch.Tensor: The computed loss as a float32 scalar tensor.
     """
     if mask is not None:
+        mask = mask.view(-1)
         loss = F.cross_entropy(logits, targets, reduction='none')
-        return torch.mean(loss * mask.view(-1))
+        loss = (loss * mask).sum() / mask.sum().clamp_min(1)
     else:
-        return F.cross_entropy(logits, targets)
+        loss = F.cross_entropy(logits, targets)
+    return loss.float()
+
+
+@torch.compile(dynamic=True)
+def _masked_cross_entropy_tile(logits, targets, mask=None):
+    """
+    Compute the summed (optionally masked) cross-entropy of a single tile of logits.
+
+    The tile is upcast to float32 here so that inductor can fuse the upcast, log-softmax
+    and gather into a single kernel instead of materializing the full float32 logits.
+    """
+    loss = F.cross_entropy(logits.float(), targets, reduction='none')
+    if mask is not None:
+        loss = loss * mask
+    return loss.sum()
+
+
+def chunked_masked_cross_entropy(logits, targets, mask=None, chunk_size=4096):
+    """
+    Compute the masked cross-entropy loss by streaming over row chunks of the logits.
+
+    Numerically equivalent to `masked_cross_entropy`, but the logits are kept in their native
+    dtype (e.g. bf16) and only one `chunk_size` x C tile is upcast to float32 at a time, which
+    avoids materializing a float32 copy of the whole (N, C) logits tensor.
+
+    Args:
+        logits (torch.Tensor): The predicted logits with shape (N, C) where C is the number of classes.
+        targets (torch.Tensor): The ground truth class indices with shape (N,).
+        mask (torch.Tensor, optional): A tensor that masks the loss computation. Must have N elements.
+            Defaults to None.
+        chunk_size (int, optional): Number of rows processed per tile. Defaults to 4096.
+
+    Returns:
+        torch.Tensor: The computed loss as a float32 scalar tensor.
+    """
+    if mask is not None:
+        mask = mask.view(-1)
+        count = mask.sum().clamp_min(1)
+    else:
+        # match F.cross_entropy's 'mean' reduction, which skips ignored targets
+        count = (targets != -100).sum()
+
+    # split (rather than slicing per tile) so that backward concatenates the tile gradients once,
+    # instead of allocating a full-size zero gradient for every tile
+    logits_chunks = logits.split(chunk_size)
+    targets_chunks = targets.split(chunk_size)
+    mask_chunks = [None] * len(logits_chunks) if mask is None else mask.split(chunk_size)
+
+    total = torch.zeros((), dtype=torch.float32, device=logits.device)
+    for logits_chunk, targets_chunk, mask_chunk in zip(logits_chunks, targets_chunks, mask_chunks):
+        total = total + _masked_cross_entropy_tile(logits_chunk, targets_chunk, mask_chunk)
+    return total / count
+
+
+def _gather_all_parameters(state_dict):
+    """
+    Gather the full tensors of all FSDP2-sharded DTensors in a state dict using batched collectives.
+
+    Calling `DTensor.full_tensor()` per entry issues one all-gather per parameter. Instead, the
+    local shards of all `Shard(0)` DTensors living on the same mesh with the same dtype are padded
+    to their even chunk size, flattened into a single buffer and gathered with one
+    `all_gather_into_tensor`, after which the full tensors are carved back out of the result.
+    DTensors with any other placement fall back to `full_tensor()`; plain tensors are returned as-is.
+    Must be called on every rank of the mesh.
+
+    Args:
+        state_dict (dict): A state dict that may contain DTensors.
+
+    Returns:
+        dict: A state dict with the same keys where every CUDA DTensor is replaced by its full tensor.
+    """
+    import torch.distributed as dist
+    from torch.distributed._tensor import DTensor, Shard
+
+    out = dict(state_dict)
+    groups = {}
+    for k, v in state_dict.items():
+        if not isinstance(v, DTensor) or v.device.type != 'cuda':
+            continue
+        if v.device_mesh.ndim == 1 and len(v.placements) == 1 and v.placements[0] == Shard(0):
+            groups.setdefault((v.device_mesh, v.dtype), []).append(k)
+        else:
+            out[k] = v.full_tensor()
+
+    for (mesh, dtype), keys in groups.items():
+        world_size = mesh.size()
+        layout, send = [], []
+        for k in keys:
+            v = state_dict[k]
+            shape = v.shape
+            chunk_rows = -(-shape[0] // world_size)
+            local = v.to_local().reshape(-1, *shape[1:])
+            pad_rows = chunk_rows - local.shape[0]
+            send.append(local.reshape(-1))
+            if pad_rows > 0:
+                send.append(local.new_zeros(pad_rows * shape[1:].numel()))
+            layout.append((k, shape, chunk_rows, chunk_rows * shape[1:].numel()))
+
+        send = torch.cat(send)
+        recv = torch.empty(world_size * send.numel(), dtype=dtype, device=send.device)
+        dist.all_gather_into_tensor(recv, send, group=mesh.get_group())
+        recv = recv.view(world_size, -1)
+
+        offset = 0
+        for k, shape, chunk_rows, numel in layout:
+            full = recv[:, offset : offset + numel].reshape(world_size * chunk_rows, *shape[1:])
+            out[k] = full[: shape[0]]
+            offset += numel
+    return out
+
+
+def _state_dict_to_cpu(state_dict):
+    """
+    Copy a state dict to CPU, batching the device-to-host copies of all CUDA tensors.
+
+    CUDA tensors are copied with a single `_foreach_copy_` rather than one `.cpu()` per tensor.
+    The destinations are regular (pageable) CPU tensors: pinned ones would come from the caching
+    host allocator, which keeps the page-locked memory for the rest of the run after every save.
+    Any other values (e.g. CPU DTensors) go through `to_cpu`.
+
+    Args:
+        state_dict (dict): A state dict, typically the output of `_gather_all_parameters`.
+
+    Returns:
+        dict: A state dict with the same keys where every tensor lives on the CPU.
+    """
+    from torch.distributed._tensor import DTensor
+
+    from nemo.lightning.pytorch.strategies.utils import to_cpu
+
+    out, keys, srcs = {}, [], []
+    for k, v in state_dict.items():
+        if isinstance(v, torch.Tensor) and not isinstance(v, DTensor) and v.device.type == 'cuda':
+            keys.append(k)
+            srcs.append(v)
+        else:
+            out[k] = to_cpu(v)
+
+    if len(srcs) > 0:
+        dsts = [torch.empty(v.shape, dtype=v.dtype) for v in srcs]
+        torch._foreach_copy_(dsts, srcs)
+        out.update(zip(keys, dsts))
+    # preserve the original key order
+    return {k: out[k] for k in state_dict}
+
+
+def _make_safetensors_compatible(state_dict):
+    """
+    Make a CPU state dict writable with `safetensors.torch.save_file`.
+
+    `save_file` rejects non-contiguous tensors and tensors that share storage, both of which can
+    show up in plain CPU state dicts (e.g. transposed views or buffers aliasing each other). Every
+    tensor is made contiguous, and tensors whose storage was already seen are cloned.
+
+    Args:
+        state_dict (dict): A state dict of CPU tensors.
+
+    Returns:
+        dict: A state dict with the same keys and values that `save_file` accepts.
+    """
+    out, seen = {}, set()
+    for k, v in state_dict.items():
+        v = v.contiguous()
+        ptr = v.untyped_storage().data_ptr()
+        if v.numel() > 0 and ptr in seen:
+            v = v.clone()
+        else:
+            seen.add(ptr)
+        out[k] = v
+    return out
 
 
 class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
@@ -64,7 +387,7 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
         model_transform (callable, optional): A function to transform the model after creation.
         model_accelerator (callable, optional): A function to apply additional accelerations or modifications.
         trust_remote_code (bool): Whether to trust remote code for model loading.
-        default_dtype (torch.dtype): The default data type for model weights.
+        default_dtype (torch.dtype): The default data type for model weights; pretrained weights are loaded in it.
         load_in_4bit (bool): Whether to load the model in 4-bit precision.
         attn_implementation (str): The attention implementation to use.
         mp_policy (MixedPrecisionPolicy): Mixed precision policy for distributed training.
@@ -76,18 +399,23 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
         model_name='gpt2',
         load_pretrained_weights=True,
         tokenizer=None,
-        loss_fn=masked_cross_entropy,
+        loss_fn=chunked_masked_cross_entropy,
         model_transform=None,
         model_accelerator=None,
         trust_remote_code=False,
         default_dtype=torch.bfloat16,
         load_in_4bit=False,
-        attn_implementation="sdpa",
+        attn_implementation=None,
         param_dtype=torch.bfloat16,
         reduce_dtype=torch.float32,
         output_dtype=None,
         cast_forward_inputs=True,
         parallelize_fn=None,
+        reduce_scatter_divide_factor=None,
+        reshard_last_block=False,
+        torch_compile=False,
+        compile_mode="reduce-overhead",
+        use_fp8=False,
     ):
         """
         Initialize the HFAutoModelForCausalLM.
@@ -96,14 +424,18 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
             model_name (str, optional): The model name or path. Defaults to 'gpt2'.
             load_pretrained_weights (bool, optional): Whether to load pretrained weights. Defaults to True.
             tokenizer (AutoTokenizer, optional): A pre-configured tokenizer. Defaults to None.
-            loss_fn (callable, optional): Loss function to use. Defaults to masked_cross_entropy.
+            loss_fn (callable, optional): Loss function to use.
+                Defaults to chunked_masked_cross_entropy.
             model_transform (callable, optional): Function to transform the model after creation. Defaults to None.
             model_accelerator (callable, optional): Function to accelerate or optimize the model. Defaults to None.
             trust_remote_code (bool, optional): Whether to trust remote code during model/tokenizer loading.
                 Defaults to False.
-            default_dtype (torch.dtype, optional): Default data type for the model. Defaults to torch.bfloat16.
+            default_dtype (torch.dtype, optional): Default data type for the model. Pretrained weights are
+                loaded in this dtype. Defaults to torch.bfloat16.
             load_in_4bit (bool, optional): Whether to load the model in 4-bit precision. Defaults to False.
-            attn_implementation (str, optional): Attention implementation to use. Defaults to "sdpa".
+            attn_implementation (str, optional): Attention implementation to use. Defaults to None, in which
+                case "flash_attention_2" is used if flash-attn is installed, the GPU supports it and the
+                model is built in fp16/bf16, otherwise "sdpa".
             param_dtype (torch.dtype, optional): Data type for model parameters in mixed precision.
                 Defaults to torch.bfloat16.
             reduce_dtype (torch.dtype, optional): Data type for reduction operations in mixed precision.
@@ -112,6 +444,19 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
                 Defaults to None.
             cast_forward_inputs (bool, optional): Whether to cast forward inputs. Defaults to True.
             parallelize_fn (callable, optional): Function for parallelizing the model. Defaults to None.
+            reduce_scatter_divide_factor (float, optional): Factor each FSDP2 module divides its local
+                gradients by in a single kernel before the reduce-scatter. Defaults to None, which uses
+                the data-parallel world size; pass False to keep FSDP2's default pre/post divide.
+            reshard_last_block (bool, optional): Whether to reshard the last transformer block after
+                forward when using the default FSDP2 parallelize function. Defaults to False, which
+                saves one all-gather before backward.
+            torch_compile (bool, optional): Whether to wrap the model with `torch.compile`. Ignored when
+                `load_in_4bit=True`. Sequences should be padded to a fixed multiple (see the data module's
+                `pad_seq_len_divisible`) to avoid recompilations. Defaults to False.
+            compile_mode (str, optional): The `torch.compile` mode. Modes that use CUDA graphs fall back to
+                "default" when a device mesh (FSDP2) is used. Defaults to "reduce-overhead".
+            use_fp8 (bool, optional): Whether to train the linear layers (except `lm_head`) in float8 using
+                `torchao.float8`. Requires torchao and an FP8-capable GPU (e.g. H100). Defaults to False.
         """
         super().__init__()
         self.save_hyperparameters()
@@ -126,6 +471,7 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
         self.trust_remote_code = trust_remote_code
         self.default_dtype = default_dtype
         self.load_in_4bit = load_in_4bit
+        # resolved in configure_model when None, since detecting it initializes CUDA
         self.attn_implementation = attn_implementation
         self.mp_policy = MixedPrecisionPolicy(
             param_dtype=param_dtype,
@@ -134,6 +480,11 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
             cast_forward_inputs=cast_forward_inputs,
         )
         self.parallelize_fn = parallelize_fn
+        self.reduce_scatter_divide_factor = reduce_scatter_divide_factor
+        self.reshard_last_block = reshard_last_block
+        self.torch_compile = torch_compile
+        self.compile_mode = compile_mode
+        self.use_fp8 = use_fp8
 
     @property
     def tokenizer(self):
@@ -147,7 +498,9 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
             AutoTokenizer: The tokenizer associated with the model.
         """
         if self._tokenizer is None:
-            self._tokenizer = HFAutoModelForCausalLM.configure_tokenizer(self.model_name, self.trust_remote_code)
+            self._tokenizer = HFAutoModelForCausalLM.configure_tokenizer(
+                self.model_name, trust_remote_code=self.trust_remote_code
+            )
         return self._tokenizer
 
     @tokenizer.setter
@@ -166,6 +519,11 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
         """
         Configure and return a Hugging Face AutoTokenizer for the given model.
 
+        If the requested implementation cannot be loaded, the other one (fast/slow) is tried instead.
+        Tokenizers are cached, so repeated calls with the same arguments return the same instance.
+        That instance is shared: modifying it (e.g. `add_special_tokens` or setting `pad_token`)
+        affects every model that uses the same tokenizer; `copy.deepcopy` it first if that is not wanted.
+
         Args:
             model_name (str): The name or path of the model.
             use_fast (bool, optional): Whether to use the fast tokenizer implementation. Defaults to True.
@@ -176,9 +534,12 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
             AutoTokenizer: The instantiated tokenizer.
         """
         try:
-            return AutoTokenizer(model_name, use_fast=use_fast, trust_remote_code=trust_remote_code)
-        except:
-            return AutoTokenizer(model_name, use_fast=not use_fast, trust_remote_code=trust_remote_code)
+            return _load_tokenizer(model_name, use_fast, trust_remote_code)
+        except (ValueError, OSError, ImportError) as e:
+            logging.debug(
+                f"Failed to load tokenizer with use_fast={use_fast}, retrying with use_fast={not use_fast}: {e}"
+            )
+            return _load_tokenizer(model_name, not use_fast, trust_remote_code)
 
     def configure_model(self):
         """
@@ -189,24 +550,36 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
         tensor parallelization if a device mesh is provided, and applies any additional
         accelerator function if specified.
 
+        When loading pretrained safetensors weights with a device mesh, the model is first created with
+        its parameters on the meta device and sharded, and the weights are then loaded straight into
+        each rank's shards, instead of materializing the full model on the CPU of every rank. Checkpoints
+        that can't be loaded this way (e.g. `.bin` only) go through `from_pretrained` as before.
+
         Raises:
             Exception: If model configuration fails.
         """
         # create all your layers here
         if self.load_pretrained_weights:
+            self._resolve_attn_implementation(self.default_dtype)
+        checkpoint = None
+        if self.load_pretrained_weights and self.device_mesh is not None and not self.load_in_4bit:
+            checkpoint = self._configure_meta_model()
+
+        if self.load_pretrained_weights and checkpoint is None:
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.model_name,
-                torch_dtype='auto',
+                torch_dtype=self.default_dtype,
                 device_map="cpu",
                 trust_remote_code=self.trust_remote_code,
                 load_in_4bit=self.load_in_4bit,
                 attn_implementation=self.attn_implementation,
             )
-        else:
+        elif not self.load_pretrained_weights:
             from transformers import AutoConfig
 
             config = AutoConfig.from_pretrained(self.model_name, trust_remote_code=self.trust_remote_code)
             dtype = getattr(config, 'torch_dtype', self.default_dtype)
+            self._resolve_attn_implementation(dtype)
             self.model = AutoModelForCausalLM.from_config(
                 config,
                 torch_dtype=dtype,
@@ -214,140 +587,402 @@ class HFAutoModelForCausalLM(pl.LightningModule, io.IOMixin, fn.FNMixin):
                 attn_implementation=self.attn_implementation,
             )
 
+        # Swap linear layers for float8 ones; must happen before FSDP2 wraps the model
+        if self.use_fp8:
+            from torchao.float8 import convert_to_float8_training
+
+            convert_to_float8_training(self.model, module_filter_fn=lambda mod, fqn: fqn != 'lm_head')
+
         # Apply FSDP2 and TP to the model
         if self.device_mesh is not None:
             if self.parallelize_fn is None:
-                self.parallelize_fn = fsdp2_strategy_parallelize
+                self.parallelize_fn = functools.partial(
+                    fsdp2_strategy_parallelize, reshard_last_block=self.reshard_last_block
+                )
             self.parallelize_fn(self.model, device_mesh=self.device_mesh, mp_policy=self.mp_policy)
 
+            # Pre-divide gradients by the DP size in one kernel instead of FSDP2's pre/post sqrt-divide
+            divide_factor = self.reduce_scatter_divide_factor
+            if divide_factor is None:
+                divide_factor = self.device_mesh["data_parallel"].size()
+            if divide_factor is not False:
+                for module in self.model.modules():
+                    if isinstance(module, FSDPModule):
+                        if hasattr(module, 'set_gradient_divide_factor'):
+                            module.set_gradient_divide_factor(divide_factor)
+                        else:
+                            module.set_reduce_scatter_divide_factor(divide_factor)
+
+            if checkpoint is not None:
+                self._load_sharded_pretrained_weights(*checkpoint)
+
         if self.model_accelerator is not None:
             self.model_accelerator(self.model)
 
+        # Cache the model's forward kwargs; used to filter batch keys on every step
+        self._allowed_batch_keys = frozenset(inspect.signature(self.model.forward).parameters.keys()) | {
+            'labels',
+            'loss_mask',
+        }
+        # GPTSFTDataset emits `tokens` instead of `input_ids`
+        self._batch_key_rename = {'tokens': 'input_ids'} if 'input_ids' in self._allowed_batch_keys else {}
+
+        # Local device of the model; resolved lazily on the first step since the strategy
+        # may still move the model after configure_model.
+        self._device = None
+
+        if self.torch_compile:
+            if self.load_in_4bit:
+                logging.warning("torch.compile is not supported with load_in_4bit=True; skipping compilation.")
+            else:
+                compile_mode = self.compile_mode
+                if self.device_mesh is not None and compile_mode in ("reduce-overhead", "max-autotune"):
+                    logging.warning(
+                        f"torch.compile mode '{compile_mode}' uses CUDA graphs, which cannot capture FSDP2 "
+                        "collectives; falling back to mode='default'."
+                    )
+                    compile_mode = "default"
+                # Compile in place so that state_dict keys and HF methods (e.g. save_pretrained) are unchanged
+                self.model.compile(mode=compile_mode, dynamic=False, fullgraph=False)
+
         self.model.train()
 
+    def _resolve_attn_implementation(self, dtype):
+        """
+        Pick the attention implementation if none was given.
+
+        flash_attention_2 only supports fp16/bf16, so it is only auto-selected when the model is
+        built in one of those dtypes; otherwise (including fp32 and a missing `torch_dtype`,
+        which HF treats as fp32) "sdpa" is used.
+
+        Args:
+            dtype (torch.dtype | str | None): The dtype the model will be built in.
+        """
+        if self.attn_implementation is not None:
+            return
+        if isinstance(dtype, str):
+            dtype = getattr(torch, dtype, None)
+        if dtype in (torch.float16, torch.bfloat16):
+            self.attn_implementation = _detect_best_attn()
+        else:
+            self.attn_implementation = "sdpa"
+
+    def _configure_meta_model(self):
+        """
+        Create the model with its parameters on the meta device, if its pretrained weights can later be
+        loaded straight into the FSDP2 shards.
+
+        That requires safetensors weights whose keys cover the whole model once mapped like
+        `from_pretrained` does; otherwise nothing is created and None is returned, so that the caller
+        falls back to `from_pretrained`.
+
+        Returns:
+            tuple | None: `(files, key_map, tied_keys)` to pass to `_load_sharded_pretrained_weights`,
+                or None.
+        """
+        from accelerate import init_empty_weights
+        from safetensors import safe_open
+        from transformers import AutoConfig
+
+        files = _find_safetensors_files(self.model_name)
+        if len(files) == 0:
+            logging.info(f"No safetensors weights found for {self.model_name}; loading with from_pretrained.")
+            return None
+
+        config = AutoConfig.from_pretrained(self.model_name, trust_remote_code=self.trust_remote_code)
+        # keep buffers (e.g. rotary inv_freq) on CPU; they are not part of the checkpoint
+        with init_empty_weights(include_buffers=False):
+            model = AutoModelForCausalLM.from_config(
+                config,
+                torch_dtype=self.default_dtype,
+                trust_remote_code=self.trust_remote_code,
+                attn_implementation=self.attn_implementation,
+            )
+
+        # from_config only derives the generation config from the model config; load the checkpoint's
+        # generation_config.json (e.g. EOS ids, sampling defaults) the way from_pretrained does
+        if model.can_generate():
+            from transformers import GenerationConfig
+
+            try:
+                model.generation_config = GenerationConfig.from_pretrained(self.model_name)
+            except OSError:
+                logging.info(
+                    "Generation config file not found, using a generation config created from the model config."
+                )
+
+        checkpoint_keys = []
+        for file in files:
+            with safe_open(file, framework="pt") as f:
+                checkpoint_keys.extend(f.keys())
+        mapping = _map_checkpoint_keys(checkpoint_keys, model)
+        if mapping is None:
+            logging.info(
+                f"The checkpoint keys of {self.model_name} don't match the model; loading with from_pretrained."
+            )
+            return None
+
+        self.model = model
+        return (files, *mapping)
+
+    def _load_sharded_pretrained_weights(self, files, key_map, tied_keys):
+        """
+        Materialize a meta-initialized, parallelized model on the local GPU and load pretrained weights.
+
+        Only rank 0 reads the checkpoint; `set_model_state_dict` broadcasts each tensor and every rank
+        keeps just its own shard. Buffers, which are not meta-initialized, are restored after `to_empty`.
+
+        Args:
+            files (list): Paths of the safetensors files.
+            key_map (dict): Checkpoint key to model key mapping.
+            tied_keys (dict): Tied parameter name to source parameter name mapping.
+        """
+        import torch.distributed as dist
+        from torch.distributed.checkpoint.state_dict import StateDictOptions, set_model_state_dict
+
+        buffers = {k: v.clone() for k, v in self.model.named_buffers()}
+        self.model.to_empty(device=torch.device('cuda', torch.cuda.current_device()))
+        with torch.no_grad():
+            for k, v in buffers.items():
+                self.model.get_buffer(k).copy_(v)
+        self.model.tie_weights()
+
+        state_dict = _load_safetensors_state_dict(files, key_map, tied_keys) if dist.get_rank() == 0 else {}
+        # strict: any parameter left out would keep the uninitialized memory from to_empty
+        set_model_state_dict(
+            self.model,
+            state_dict,
+            options=StateDictOptions(full_state_dict=True, broadcast_from_rank0=True, strict=True),
+        )
+
     def forward(self, batch):
         """
         Perform a forward pass of the model.
 
+        In training mode the KV cache is disabled, since its tensors would never be read.
+
         Args:
             batch (dict): A dictionary of inputs that the model expects.
 
         Returns:
             ModelOutput: The output of the underlying Hugging Face model.
         """
-        return self.model(**batch)
+        if self.training:
+            return self.model(**batch, use_cache=False, return_dict=True)
+        return self.model(**batch, return_dict=True)
 
-    def training_step(self, batch, batch_idx=None):
+    def _step(self, batch, stage):
         """
-        Execute a single training step.
+        Shared implementation of the training and validation steps.
 
         This method prepares the input batch by ensuring the required keys are present,
         performs a forward pass, reshapes the logits and labels appropriately, computes the loss
-        using the defined loss function, and logs the training loss.
+        using the defined loss function, and logs it as `{stage}_loss`.
 
         Args:
             batch (dict): A dictionary containing the batch data, including 'labels' and optionally 'loss_mask'.
-            batch_idx (int, optional): The index of the batch. Defaults to None.
+            stage (str): Either 'train' or 'val'; used as the prefix of the logged loss.
 
         Returns:
             torch.Tensor: The computed loss for the batch.
         """
-        labels = batch.pop('labels').to(self.model.device)
+        if self._device is None:
+            self._device = next(self.model.parameters()).device
+
+        # Issue the H2D copies asynchronously so they overlap with batch filtering and forward
+        labels = batch.pop('labels').to(self._device, non_blocking=True)
         loss_mask = batch.pop('loss_mask', None)
+        if loss_mask is not None:
+            loss_mask = loss_mask.to(self._device, non_blocking=True)
 
-        # GPTSFTDataset emits `tokens` instead of `input_ids`
-        if not 'input_ids' in batch and 'tokens' in batch:
-            batch['input_ids'] = batch['tokens']
-        batch = self._remove_extra_batch_keys(batch)
+        batch = self._prepare_batch(batch)
 
         outputs = self.forward(batch)
 
-        # Prepare for loss calculation
-        logits = outputs.logits.float()
-        n_cls = logits.shape[-1]
-        logits = logits.view(-1, n_cls)
-        labels = labels.view(-1)
-
-        assert logits.shape[-2] == labels.shape[-1], "Expected logits & labels to have the same length"
+        # Flatten to (B*T, V) / (B*T,)
+        logits = outputs.logits.flatten(0, -2)
+        labels = labels.flatten()
+        # host-side shape check only; chunked losses would otherwise silently drop extra labels
+        assert logits.shape[0] == labels.shape[0], "Expected logits & labels to have the same length"
         loss = self.loss_fn(logits, labels, loss_mask)
-        self.log('train_loss', loss, on_step=True, on_epoch=True, prog_bar=True)
+        self.log(f'{stage}_loss', loss, on_step=True, on_epoch=True, prog_bar=True)
         return loss
 
+    def training_step(self, batch, batch_idx=None):
+        """
+        Execute a single training step.
+
+        Args:
+            batch (dict): A dictionary containing the batch data, including 'labels' and optionally 'loss_mask'.
+            batch_idx (int, optional): The index of the batch. Defaults to None.
+
+        Returns:
+            torch.Tensor: The computed loss for the batch.
+        """
+        return self._step(batch, stage='train')
+
     @torch.no_grad
     def validation_step(self, batch, batch_idx):
         """
         Execute a single validation step.
 
         This method is similar to `training_step` but without gradient computations.
-        It processes the input batch, performs a forward pass, computes the loss,
-        and logs the validation loss.
 
         Args:
             batch (dict): A dictionary containing the batch data, including 'labels' and optionally 'loss_mask'.
             batch_idx (int): The index of the batch.
         """
-        labels = batch.pop('labels').to(self.model.device)
-        loss_mask = batch.pop('loss_mask', None)
-
-        # GPTSFTDataset emits `tokens` instead of `input_ids`
-        if not 'input_ids' in batch and 'tokens' in batch:
-            batch['input_ids'] = batch['tokens']
-        batch = self._remove_extra_batch_keys(batch)
-
-        outputs = self.forward(**batch)
-
-        logits = outputs.logits.float()
-        n_cls = logits.shape[-1]
-        logits = logits.view(-1, n_cls)
-        labels = labels.view(-1)
+        self._step(batch, stage='val')
 
-        assert logits.shape[-2] == labels.shape[-1], "Expected logits & labels to have the same length"
-        loss = self.loss_fn(logits, labels, loss_mask)
-        self.log('val_loss', loss, on_step=True, on_epoch=True, prog_bar=True)
-
-    def save_pretrained(self, path):
+    def save_pretrained(self, path, sharded=False, max_shard_size=5 * 1024**3):
         """
         Save the pretrained model and tokenizer to a specified path.
 
         This method ensures that the model state is gathered (especially in distributed settings)
         and then saves the state dict and tokenizer. Only rank 0 or the appropriate FSDP module saves
-        the files to avoid race conditions.
+        the files to avoid race conditions. The state dict is gathered and written one safetensors
+        shard at a time, so rank 0 holds at most three shards in CPU memory (one being written, one
+        queued for writing and one being gathered) rather than the whole model.
+
+        With `sharded=True`, the gather is skipped altogether: every rank writes its own shards
+        with `torch.distributed.checkpoint`, and rank 0 additionally writes the HF config and tokenizer.
 
         Args:
             path (str): The directory path where the model and tokenizer should be saved.
+            sharded (bool, optional): Whether to save a sharded distributed checkpoint instead of
+                a full Hugging Face checkpoint. Defaults to False.
+            max_shard_size (int, optional): Maximum size in bytes of each safetensors file of a
+                full Hugging Face checkpoint. Defaults to 5GiB.
 
         Raises:
             AssertionError: If the model has not been created prior to saving.
         """
         assert self.model is not None, "Model has to be created first."
         import torch.distributed as dist
-        from nemo.lightning.pytorch.strategies.utils import to_cpu
 
         is_dist = dist.is_initialized()
         rank = dist.get_rank() if is_dist else 0
         is_rank0 = not is_dist or (is_dist and rank == 0)
 
-        if is_rank0 or type(self.model).__name__.startswith('FSDP'):
-            cpu_state_dict = {k: to_cpu(v) for k, v in self.model.state_dict().items()}
+        if sharded:
+            import torch.distributed.checkpoint as dcp
+            from torch.distributed.checkpoint.state_dict import StateDictOptions, get_model_state_dict
+
+            state_dict = get_model_state_dict(self.model, options=StateDictOptions(full_state_dict=False))
+            dcp.save(state_dict, checkpoint_id=path)
+        elif is_rank0 or isinstance(self.model, (FSDPModule, FSDP1)):
+            # every FSDP rank has to take part in gathering the sharded parameters
+            self._save_safetensors_shards(path, max_shard_size, is_rank0)
 
         if is_rank0:
-            self.model.save_pretrained(path, state_dict=cpu_state_dict)
+            self.model.config.save_pretrained(path)
+            if getattr(self.model, 'generation_config', None) is not None:
+                self.model.generation_config.save_pretrained(path)
             if self._tokenizer is not None:
                 self._tokenizer.save_pretrained(path)
             else:
                 logging.warning("A tokenizer wasn't created before to save.")
 
-    def _remove_extra_batch_keys(self, batch, reserved_keys=['labels', 'loss_mask']):
-        """Remove extra keys from batch that are not kwargs in model's forward
+    def _save_safetensors_shards(self, path, max_shard_size, is_rank0):
+        """
+        Gather the model's state dict and stream it to disk as Hugging Face safetensors shards.
+
+        Parameters are grouped into shards of at most `max_shard_size` bytes. Each shard is gathered
+        (all FSDP ranks must call this method), copied to CPU on rank 0 and handed to a background
+        writer thread through a bounded queue, so writing shard N overlaps with gathering shard N + 1.
+        As in `transformers`, tied parameters are only saved once, under their first name, and keys
+        listed in the model's `_keys_to_ignore_on_save` are skipped.
+
+        Args:
+            path (str): The directory path where the shards should be saved.
+            max_shard_size (int): Maximum size in bytes of each shard.
+            is_rank0 (bool): Whether this is the rank that writes the files.
+        """
+        import gc
+        import json
+        import os
+        import queue
+        import threading
+
+        from safetensors.torch import save_file
+
+        state_dict = self.model.state_dict()
+        skip_keys = {name for name, _ in self.model.named_parameters(remove_duplicate=False)} - {
+            name for name, _ in self.model.named_parameters()
+        }
+        skip_keys |= set(getattr(self.model, '_keys_to_ignore_on_save', None) or [])
+
+        shards, shard_size, total_size = [[]], 0, 0
+        for k, v in state_dict.items():
+            if k in skip_keys:
+                continue
+            nbytes = v.numel() * v.element_size()
+            if shard_size + nbytes > max_shard_size and len(shards[-1]) > 0:
+                shards.append([])
+                shard_size = 0
+            shards[-1].append(k)
+            shard_size += nbytes
+            total_size += nbytes
+
+        if is_rank0:
+            os.makedirs(path, exist_ok=True)
+            pending = queue.Queue(maxsize=1)
+            errors = []
+
+            def writer():
+                while (item := pending.get()) is not None:
+                    # keep draining the queue after a failure so the producer never blocks
+                    if len(errors) == 0:
+                        try:
+                            save_file(item[1], os.path.join(path, item[0]), metadata={'format': 'pt'})
+                        except Exception as e:
+                            errors.append(e)
+
+            thread = threading.Thread(target=writer, daemon=True)
+            thread.start()
+
+        weight_map = {}
+        for i, keys in enumerate(shards):
+            if len(shards) == 1:
+                filename = 'model.safetensors'
+            else:
+                filename = f'model-{i + 1:05d}-of-{len(shards):05d}.safetensors'
+            shard = _gather_all_parameters({k: state_dict[k] for k in keys})
+            if is_rank0:
+                pending.put((filename, _make_safetensors_compatible(_state_dict_to_cpu(shard))))
+                weight_map.update(dict.fromkeys(keys, filename))
+            del shard
+            gc.collect()
+
+        if is_rank0:
+            pending.put(None)
+            thread.join()
+            if len(errors) > 0:
+                raise errors[0]
+            if len(shards) > 1:
+                index = {'metadata': {'total_size': total_size}, 'weight_map': weight_map}
+                with open(os.path.join(path, 'model.safetensors.index.json'), 'w') as f:
+                    json.dump(index, f, indent=2, sort_keys=True)
+
+    def _prepare_batch(self, batch):
+        """Rename aliased keys (e.g. `tokens` -> `input_ids`) and remove keys that are not kwargs
+        in model's forward, in a single pass over the batch.
+
+        An alias is only renamed if the batch doesn't already contain its target key.
 
         Args:
             batch (dict): dictionary of tensors.
 
         Returns:
-            dict: dictionary of tensors; keys that are not in model's forward are removed.
+            dict: dictionary of tensors; keys are renamed and keys that are not in model's forward are removed.
         """
-        import inspect
-
-        fwd_signature = inspect.signature(self.model.forward)
-        allowed_keys = list(fwd_signature.parameters.keys()) + reserved_keys
-        return {k: batch[k] for k in allowed_keys if k in batch}
+        rename = self._batch_key_rename
+        out = {}
+        for k, v in batch.items():
+            if k in rename:
+                if rename[k] in batch:
+                    continue
+                k = rename[k]
+            if k in self._allowed_batch_keys:
+                out[k] = v
+        return out
@@ -31,7 +31,22 @@ def is_nemo2_checkpoint(checkpoint_path: str) -> bool:
     return (ckpt_path / 'context').is_dir()
 
 
-# Copied from nemo.collections.nlp.parts.utils_funcs to avoid introducing extra NeMo dependencies:
+_PRECISION_TO_DTYPE = {
+    'bf16': torch.bfloat16,
+    'bf16-mixed': torch.bfloat16,
+    16: torch.float16,
+    '16': torch.float16,
+    '16-mixed': torch.float16,
+    32: torch.float32,
+    '32': torch.float32,
+    '32-true': torch.float32,
+    'fp8': torch.float8_e4m3fn,
+    'fp8-e4m3': torch.float8_e4m3fn,
+    'fp8-e5m2': torch.float8_e5m2,
+}
+
+
+# Adapted from nemo.collections.nlp.parts.utils_funcs to avoid introducing extra NeMo dependencies:
 def torch_dtype_from_precision(precision: Union[int, str], megatron_amp_O2: bool = True) -> torch.dtype:
     """
     Mapping from PyTorch Lighthing (PTL) precision types to corresponding PyTorch parameter data type.
@@ -46,11 +61,7 @@ def torch_dtype_from_precision(precision: Union[int, str], megatron_amp_O2: bool
     if not megatron_amp_O2:
         return torch.float32
 
-    if precision in ['bf16', 'bf16-mixed']:
-        return torch.bfloat16
-    elif precision in [16, '16', '16-mixed']:
-        return torch.float16
-    elif precision in [32, '32', '32-true']:
-        return torch.float32
-    else:
-        raise ValueError(f"Could not parse the precision of '{precision}' to a valid torch.dtype")
+    try:
+        return _PRECISION_TO_DTYPE[precision]
+    except (KeyError, TypeError):
+        raise ValueError(f"Could not parse the precision of '{precision}' to a valid torch.dtype") from None
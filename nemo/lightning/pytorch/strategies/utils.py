@@ -445,12 +445,15 @@ def fsdp2_strategy_parallelize(
     model,
     device_mesh: DeviceMesh = None,
     mp_policy: MixedPrecisionPolicy = MixedPrecisionPolicy(param_dtype=torch.bfloat16, reduce_dtype=torch.float32),
+    reshard_last_block: bool = False,
 ):
     """Apply parallelisms and activation checkpointing to the model.
     NOTE: The passed-in model preferably should be on meta device. Otherwise,
     the model must fit on GPU or CPU memory.
     NOTE: Currently, the user is required to manually handle precision settings such as the `mp_policy` here
     because the model parallel strategy does not respect all settings of `Fabric(precision=...)` at the moment.
+    NOTE: By default the last transformer block is not resharded after forward, which saves one
+    all-gather before backward; set `reshard_last_block=True` to reshard every block.
     """
 
     dp_mesh = device_mesh["data_parallel"]
@@ -463,7 +466,7 @@ def fsdp2_strategy_parallelize(
                 # transformer_block = checkpoint_wrapper(transformer_block)
                 # As an optimization, do not reshard after forward for the last
                 # transformer block since FSDP would prefetch it immediately
-                reshard_after_forward = int(layer_id) < len(module) - 1
+                reshard_after_forward = reshard_last_block or int(layer_id) < len(module) - 1
                 fully_shard(
                     transformer_block,
                     mesh=mesh,
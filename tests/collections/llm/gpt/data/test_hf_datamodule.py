@@ -164,3 +164,17 @@ def test_validate_dataset_asset_accessibility_file_is_none():
         exception_msg = str(e)
 
     assert exception_msg == expected_msg, exception_msg
+
+
+def test_collate_fn_pad_seq_len_divisible():
+    batch = [
+        {'input_ids': [1, 2, 3], 'loss_mask': [1, 1, 1]},
+        {'input_ids': [4, 5], 'loss_mask': [1, 1]},
+    ]
+    out = llm.HFDatasetDataModule.collate_fn(batch, pad_token_id=7, pad_seq_len_divisible=8)
+    assert out['input_ids'].shape == (2, 8)
+    assert out['input_ids'][1].tolist() == [4, 5] + [7] * 6
+    assert out['loss_mask'][1].tolist() == [1, 1] + [0] * 6
+
+    out = llm.HFDatasetDataModule.collate_fn(batch, pad_token_id=7)
+    assert out['input_ids'].shape == (2, 3)
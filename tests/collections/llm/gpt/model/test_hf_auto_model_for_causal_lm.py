@@ -0,0 +1,196 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import inspect
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn.functional as F
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from nemo.collections.llm.gpt.model.hf_auto_model_for_causal_lm import (
+    HFAutoModelForCausalLM,
+    _make_safetensors_compatible,
+    _map_checkpoint_keys,
+    chunked_masked_cross_entropy,
+    masked_cross_entropy,
+)
+
+
+def _tiny_gpt2():
+    return GPT2LMHeadModel(GPT2Config(n_layer=2, n_embd=32, n_head=2, vocab_size=128, n_positions=16))
+
+
+def test_map_checkpoint_keys_adds_base_model_prefix():
+    model = _tiny_gpt2()
+    # the GPT-2 checkpoints on the hub store `h.0...`/`wte.weight` without the `transformer.` prefix
+    checkpoint_keys = [k[len('transformer.') :] for k in model.state_dict() if k.startswith('transformer.')]
+    key_map, tied_keys = _map_checkpoint_keys(checkpoint_keys + ['h.0.attn.masked_bias'], model)
+
+    assert key_map['wte.weight'] == 'transformer.wte.weight'
+    assert key_map['h.1.mlp.c_fc.weight'] == 'transformer.h.1.mlp.c_fc.weight'
+    # unknown checkpoint keys are dropped
+    assert 'h.0.attn.masked_bias' not in key_map
+    assert tied_keys == {'lm_head.weight': 'transformer.wte.weight'}
+
+
+def test_map_checkpoint_keys_returns_none_on_missing_keys():
+    model = _tiny_gpt2()
+    checkpoint_keys = [k for k in model.state_dict() if not k.startswith('transformer.h.1.')]
+    assert _map_checkpoint_keys(checkpoint_keys, model) is None
+
+
+def test_make_safetensors_compatible(tmp_path):
+    from safetensors.torch import load_file, save_file
+
+    weight = torch.randn(4, 3)
+    state_dict = {'a': weight, 'b': weight, 'c': weight.t(), 'd': weight[1]}
+    out = _make_safetensors_compatible(state_dict)
+
+    assert all(v.is_contiguous() for v in out.values())
+    save_file(out, tmp_path / 'model.safetensors')
+    loaded = load_file(tmp_path / 'model.safetensors')
+    for k, v in state_dict.items():
+        assert torch.equal(loaded[k], v)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 16, 64])
+@pytest.mark.parametrize("use_mask", [False, True])
+def test_chunked_masked_cross_entropy_matches_masked_cross_entropy(chunk_size, use_mask):
+    torch.manual_seed(0)
+    logits = torch.randn(30, 11)
+    targets = torch.randint(0, 11, (30,))
+    targets[::4] = -100
+    mask = (torch.rand(30) > 0.3).long() if use_mask else None
+
+    expected = masked_cross_entropy(logits, targets, mask)
+    actual = chunked_masked_cross_entropy(logits, targets, mask, chunk_size=chunk_size)
+    assert actual.dtype == torch.float32
+    torch.testing.assert_close(actual, expected)
+
+
+@pytest.mark.parametrize("loss_fn", [masked_cross_entropy, chunked_masked_cross_entropy])
+def test_masked_cross_entropy_normalizes_by_mask_count(loss_fn):
+    torch.manual_seed(0)
+    logits = torch.randn(8, 5)
+    targets = torch.randint(0, 5, (8,))
+    mask = torch.tensor([1, 0, 1, 1, 0, 0, 1, 0])
+
+    per_token = F.cross_entropy(logits, targets, reduction='none')
+    torch.testing.assert_close(loss_fn(logits, targets, mask), per_token[mask.bool()].sum() / 4)
+    # a fully masked batch yields zero instead of NaN
+    assert loss_fn(logits, targets, torch.zeros(8, dtype=torch.long)).item() == 0.0
+
+
+def _batch_preparer():
+    # mimics the attributes set up by HFAutoModelForCausalLM.configure_model
+    return SimpleNamespace(
+        _allowed_batch_keys=frozenset({'input_ids', 'attention_mask', 'labels', 'loss_mask'}),
+        _batch_key_rename={'tokens': 'input_ids'},
+    )
+
+
+def test_prepare_batch_renames_tokens_and_drops_extra_keys():
+    tokens = torch.tensor([[1, 2, 3]])
+    batch = {'tokens': tokens, 'attention_mask': torch.ones(1, 3), 'position_ids': torch.arange(3)}
+    out = HFAutoModelForCausalLM._prepare_batch(_batch_preparer(), batch)
+
+    assert set(out.keys()) == {'input_ids', 'attention_mask'}
+    assert out['input_ids'] is tokens
+
+
+@pytest.mark.parametrize("tokens_first", [True, False])
+def test_prepare_batch_keeps_existing_input_ids(tokens_first):
+    tokens, input_ids = torch.tensor([[1, 2]]), torch.tensor([[3, 4]])
+    items = [('tokens', tokens), ('input_ids', input_ids)]
+    batch = dict(items if tokens_first else items[::-1])
+    out = HFAutoModelForCausalLM._prepare_batch(_batch_preparer(), batch)
+
+    assert list(out.keys()) == ['input_ids']
+    assert out['input_ids'] is input_ids
+
+
+@pytest.mark.parametrize("chunk_size", [7, 16])
+@pytest.mark.parametrize("use_mask", [False, True])
+def test_chunked_masked_cross_entropy_grad_matches_masked_cross_entropy(chunk_size, use_mask):
+    torch.manual_seed(0)
+    logits = torch.randn(30, 11)
+    targets = torch.randint(0, 11, (30,))
+    targets[::4] = -100
+    mask = (torch.rand(30) > 0.3).long() if use_mask else None
+
+    expected_logits = logits.clone().requires_grad_()
+    masked_cross_entropy(expected_logits, targets, mask).backward()
+    actual_logits = logits.clone().requires_grad_()
+    chunked_masked_cross_entropy(actual_logits, targets, mask, chunk_size=chunk_size).backward()
+
+    torch.testing.assert_close(actual_logits.grad, expected_logits.grad)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, None, 'float32'])
+def test_resolve_attn_implementation_uses_sdpa_outside_fp16_bf16(dtype):
+    model = SimpleNamespace(attn_implementation=None)
+    HFAutoModelForCausalLM._resolve_attn_implementation(model, dtype)
+    assert model.attn_implementation == "sdpa"
+
+
+def test_resolve_attn_implementation_keeps_explicit_choice():
+    model = SimpleNamespace(attn_implementation="eager")
+    HFAutoModelForCausalLM._resolve_attn_implementation(model, torch.bfloat16)
+    assert model.attn_implementation == "eager"
+
+
+def _tiny_hf_auto_model():
+    model = HFAutoModelForCausalLM()
+    model.model = _tiny_gpt2()
+    # mirror the attributes set up by configure_model
+    model._allowed_batch_keys = frozenset(inspect.signature(model.model.forward).parameters.keys()) | {
+        'labels',
+        'loss_mask',
+    }
+    model._batch_key_rename = {'tokens': 'input_ids'}
+    model._device = torch.device('cpu')
+    logged = {}
+    model.log = lambda name, value, **kwargs: logged.__setitem__(name, value)
+    return model, logged
+
+
+def _tiny_batch():
+    torch.manual_seed(0)
+    input_ids = torch.randint(0, 128, (2, 8))
+    return {
+        'tokens': input_ids,
+        'labels': torch.roll(input_ids, -1, dims=1),
+        'loss_mask': torch.ones(2, 8, dtype=torch.long),
+        'position_ids': torch.arange(8).expand(2, 8),
+    }
+
+
+def test_training_step_returns_finite_loss():
+    model, logged = _tiny_hf_auto_model()
+    model.train()
+    loss = model.training_step(_tiny_batch(), 0)
+
+    assert torch.isfinite(loss)
+    assert loss.requires_grad
+    assert torch.equal(logged['train_loss'], loss)
+
+
+def test_validation_step_logs_finite_loss():
+    model, logged = _tiny_hf_auto_model()
+    model.eval()
+    model.validation_step(_tiny_batch(), 0)
+
+    assert torch.isfinite(logged['val_loss'])
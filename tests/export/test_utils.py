@@ -0,0 +1,53 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from nemo.export.utils import torch_dtype_from_precision
+
+
+@pytest.mark.parametrize(
+    "precision, dtype",
+    [
+        ('bf16', torch.bfloat16),
+        ('bf16-mixed', torch.bfloat16),
+        (16, torch.float16),
+        ('16', torch.float16),
+        ('16-mixed', torch.float16),
+        (32, torch.float32),
+        ('32', torch.float32),
+        ('32-true', torch.float32),
+    ],
+)
+def test_torch_dtype_from_precision(precision, dtype):
+    assert torch_dtype_from_precision(precision) == dtype
+
+
+def test_torch_dtype_from_precision_without_megatron_amp_o2():
+    assert torch_dtype_from_precision('bf16', megatron_amp_O2=False) == torch.float32
+
+
+@pytest.mark.parametrize("precision", ['fp64', 64, None, ['bf16']])
+def test_torch_dtype_from_precision_invalid(precision):
+    with pytest.raises(ValueError):
+        torch_dtype_from_precision(precision)
+
+
+@pytest.mark.parametrize(
+    "precision, dtype",
+    [('fp8', torch.float8_e4m3fn), ('fp8-e4m3', torch.float8_e4m3fn), ('fp8-e5m2', torch.float8_e5m2)],
+)
+def test_torch_dtype_from_precision_fp8(precision, dtype):
+    assert torch_dtype_from_precision(precision) == dtype